@@ -3,10 +3,16 @@ import google.generativeai as genai
 from tavily import TavilyClient
 import json
 import re
+import time
 from datetime import datetime
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
+from upstream import tavily_scheduler, gemini_scheduler, UpstreamBudgetExceeded, INTERACTIVE
+from deadlines import (Deadline, StageTimeout, run_with_timeout, hedged_call,
+                       CHAT_DEADLINE_SECONDS, SEARCH_STAGE_SECONDS, SCRAPE_STAGE_SECONDS,
+                       LLM_RESERVE_SECONDS, MIN_STAGE_SECONDS)
+from companies import company_index, company_key, split_subject
 
 # API Keys (Embedded as requested)
 GEMINI_API_KEY = "YOUR_GEMINI_API_KEY"
@@ -18,6 +24,8 @@ genai.configure(api_key=GEMINI_API_KEY)
 # Configure Tavily
 tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
 
+LLM_TIMEOUT_TEXT = "I ran out of time putting together a full answer. Please try again in a moment."
+
 class ResearchAgent:
     def __init__(self):
         self.model = genai.GenerativeModel('gemini-2.0-flash')
@@ -57,33 +65,52 @@ Your goal is to help users research companies, analyze markets, and build detail
 - **Bold** key metrics.
 """
 
-    def search_company(self, query):
+    def _tavily_search(self, query, deadline, priority=INTERACTIVE, **kwargs):
+        """Deadline-bound Tavily search, hedged with a second request if the first is slow."""
+        def search():
+            # The HTTP timeout is what actually frees the pool worker if Tavily hangs
+            return tavily_client.search(query, timeout=max(deadline.remaining(), 0.1), **kwargs)
+
+        def primary():
+            return tavily_scheduler.call(search, priority=priority, max_wait=deadline.remaining())
+
+        def hedge():
+            # Only hedge when a token is free right now; never queue behind real traffic
+            return tavily_scheduler.call(search, priority=priority, max_wait=0)
+
+        return hedged_call(primary, deadline, hedge_fn=hedge)
+
+    def search_company(self, query, priority=INTERACTIVE, deadline=None, company_name=None):
         """Searches for company information using Tavily with enhanced accuracy."""
         print(f"Searching for: {query}")
+        deadline = deadline or Deadline(SEARCH_STAGE_SECONDS)
+        started = time.monotonic()
+        if deadline.remaining() < MIN_STAGE_SECONDS:
+            deadline.record('search', 'skipped', started)
+            return ""
         try:
             # Perform multiple targeted searches for better accuracy
             all_results = []
+            status = 'ok'
             
-            # Search 1: General company info
-            response1 = tavily_client.search(query, search_depth="advanced", max_results=3)
-            all_results.extend(response1.get('results', []))
-            
-            # Search 2: Recent news and updates
-            company_name = query.split()[0]  # Extract company name
-            response2 = tavily_client.search(
-                f"{company_name} latest news financial results 2024 2025", 
-                search_depth="advanced", 
-                max_results=3
-            )
-            all_results.extend(response2.get('results', []))
-            
-            # Search 3: Financial metrics
-            response3 = tavily_client.search(
-                f"{company_name} revenue earnings market cap stock price", 
-                search_depth="advanced", 
-                max_results=2
-            )
-            all_results.extend(response3.get('results', []))
+            company_name = company_name or query.split()[0]  # Extract company name
+            searches = [
+                # Search 1: General company info
+                (query, 3),
+                # Search 2: Recent news and updates
+                (f"{company_name} latest news financial results 2024 2025", 3),
+                # Search 3: Financial metrics
+                (f"{company_name} revenue earnings market cap stock price", 2),
+            ]
+            for search_query, max_results in searches:
+                try:
+                    response = self._tavily_search(search_query, deadline, priority,
+                                                   search_depth="advanced", max_results=max_results)
+                except StageTimeout:
+                    # Out of time: answer with whatever arrived
+                    status = 'timeout'
+                    break
+                all_results.extend(response.get('results', []))
             
             # Combine and format results
             context = "\n\n".join([
@@ -91,10 +118,15 @@ Your goal is to help users research companies, analyze markets, and build detail
                 for result in all_results
             ])
             
+            deadline.record('search', status, started)
             return context
+        except UpstreamBudgetExceeded:
+            raise
         except Exception as e:
+            # Never hand error text to the LLM as if it were research context
             print(f"Error performing search: {str(e)}")
-            return f"Error performing search: {str(e)}"
+            deadline.record('search', 'error', started)
+            return ""
 
     def should_search(self, user_message):
         """Determine if we need to search based on keywords."""
@@ -120,31 +152,38 @@ Your goal is to help users research companies, analyze markets, and build detail
 
     def extract_company_name(self, user_message):
         """Extract company name from user message."""
-        # Simple extraction - look for capitalized words or known patterns
-        words = user_message.split()
-        for i, word in enumerate(words):
-            if word.lower() in ['research', 'about', 'on', 'for']:
-                if i + 1 < len(words):
-                    return ' '.join(words[i+1:]).strip('.,!?')
-        
-        # Fallback: return the whole message if it's short
-        if len(words) <= 3:
-            return user_message.strip('.,!?')
-        
-        return user_message
+        # Simple extraction - the words after "research"/"about"/"on"/"for", or the message
+        return split_subject(user_message)[1]
 
-    def scrape_company_website(self, company_name):
+    def resolve_company(self, user_message):
+        """
+        Resolve a message to (company_id, company_name) via the local alias index,
+        falling back to the subject's first clause with a normalized key.
+        """
+        match, company_name = company_index.resolve_message(user_message)
+        if match:
+            return match['id'], match['name']
+        return company_key(company_name), company_name
+
+    def scrape_company_website(self, company_name, priority=INTERACTIVE, deadline=None):
         """Scrape company website for additional information."""
+        deadline = deadline or Deadline(SCRAPE_STAGE_SECONDS)
+        started = time.monotonic()
+        if deadline.remaining() < MIN_STAGE_SECONDS:
+            deadline.record('scrape', 'skipped', started)
+            return None
         try:
             # Try to find company website
             search_query = f"{company_name} official website"
-            response = tavily_client.search(search_query, max_results=1)
+            response = self._tavily_search(search_query, deadline, priority, max_results=1)
             
             if not response.get('results'):
+                deadline.record('scrape', 'ok', started)
                 return None
             
             url = response['results'][0].get('url', '')
             if not url:
+                deadline.record('scrape', 'ok', started)
                 return None
             
             print(f"Scraping website: {url}")
@@ -153,7 +192,8 @@ Your goal is to help users research companies, analyze markets, and build detail
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
-            page_response = requests.get(url, headers=headers, timeout=10)
+            page_response = run_with_timeout(requests.get, deadline, url, headers=headers,
+                                             timeout=min(10, max(deadline.remaining(), 0.1)))
             page_response.raise_for_status()
             
             # Parse with BeautifulSoup
@@ -177,10 +217,15 @@ Your goal is to help users research companies, analyze markets, and build detail
             text_content = ' '.join([p.get_text().strip() for p in paragraphs[:10]])
             scraped_data['key_points'] = text_content[:1000]
             
+            deadline.record('scrape', 'ok', started)
             return scraped_data
             
+        except (StageTimeout, requests.Timeout):
+            deadline.record('scrape', 'timeout', started)
+            return None
         except Exception as e:
             print(f"Error scraping website: {e}")
+            deadline.record('scrape', 'error', started)
             return None
 
     def detect_conflicts(self, text, company_name):
@@ -562,10 +607,39 @@ Your goal is to help users research companies, analyze markets, and build detail
         
         return chart_data if chart_data['datasets'] else None
 
-    def process_message(self, user_message):
+    def generate(self, chat, content, priority=INTERACTIVE, deadline=None):
+        """Send one Gemini turn bounded by the remaining deadline; returns None on timeout."""
+        deadline = deadline or Deadline(LLM_RESERVE_SECONDS)
+        started = time.monotonic()
+        try:
+            response = run_with_timeout(
+                gemini_scheduler.call, deadline, chat.send_message, content,
+                request_options={'timeout': max(deadline.remaining(), MIN_STAGE_SECONDS)},
+                priority=priority, max_wait=deadline.remaining()
+            )
+        except StageTimeout:
+            deadline.record('llm', 'timeout', started)
+            return None
+        except Exception as e:
+            if type(e).__name__ == 'DeadlineExceeded':
+                deadline.record('llm', 'timeout', started)
+                return None
+            raise
+        deadline.record('llm', 'ok', started)
+        return response
+
+    def _drop_unanswered_turn(self):
+        """Remove the pending user turn so the history stays user/model alternating."""
+        if self.conversation_history and self.conversation_history[-1]["role"] == "user":
+            self.conversation_history.pop()
+
+    def process_message(self, user_message, priority=INTERACTIVE, deadline=None):
         """
         Processes the user message with enhanced data extraction and conversation memory.
+        Upstream calls are scheduled at `priority`; UpstreamBudgetExceeded propagates to the caller.
+        Stages share `deadline`: search and scrape are cut short or skipped so the LLM call keeps its reserve.
         """
+        deadline = deadline or Deadline(CHAT_DEADLINE_SECONDS)
         try:
             # Add user message to history
             self.conversation_history.append({
@@ -575,16 +649,24 @@ Your goal is to help users research companies, analyze markets, and build detail
             
             # Check if we should search
             if self.should_search(user_message):
+                # Don't spend Tavily quota on a turn Gemini would turn away anyway
+                gemini_scheduler.check(priority, max_wait=deadline.remaining())
                 print("DEBUG: Starting search...")
-                company_name = self.extract_company_name(user_message)
-                print(f"DEBUG: Extracted company name: {company_name}")
+                company_id, company_name = self.resolve_company(user_message)
+                print(f"DEBUG: Resolved company: {company_name} ({company_id})")
                 
                 # Perform search
-                search_results = self.search_company(f"{company_name} company overview news financials strategy market share competitors")
+                search_results = self.search_company(f"{company_name} company overview news financials strategy market share competitors", priority=priority,
+                                                     deadline=deadline.sub(SEARCH_STAGE_SECONDS, reserve=LLM_RESERVE_SECONDS),
+                                                     company_name=company_name)
                 print(f"DEBUG: Search results length: {len(str(search_results))}")
                 
                 # Scrape company website for additional info
-                scraped_data = self.scrape_company_website(company_name)
+                # (supplementary: a budget rejection or timeout here just skips the scrape)
+                scraped_data = self.scrape_company_website(
+                    company_name, priority=priority,
+                    deadline=deadline.sub(SCRAPE_STAGE_SECONDS, reserve=LLM_RESERVE_SECONDS)
+                )
                 if scraped_data:
                     print(f"DEBUG: Scraped website data from {scraped_data['url']}")
                     # Append scraped data to search results
@@ -597,6 +679,7 @@ Your goal is to help users research companies, analyze markets, and build detail
                 print("DEBUG: Extracting structured data...")
                 try:
                     structured_data = self.extract_structured_data(search_results, company_name)
+                    structured_data['company_id'] = company_id
                     if scraped_data:
                         structured_data['scraped_info'] = scraped_data
                     print("DEBUG: Structured data extracted successfully.")
@@ -606,14 +689,12 @@ Your goal is to help users research companies, analyze markets, and build detail
                     traceback.print_exc()
                     structured_data = {}
 
-                self.research_data[company_name] = structured_data
-                
                 # Build context for LLM with search results
                 context = f"""User asked: "{user_message}"
 
 I have searched for information about {company_name}. Here are the results:
 
-{search_results}
+{search_results or "(No search results could be retrieved. Answer from general knowledge and say that live data was unavailable.)"}
 
 Please synthesize these results into a helpful response. Remember to:
 1. Use Markdown headers (## Topic) for key sections
@@ -633,7 +714,15 @@ Please synthesize these results into a helpful response. Remember to:
                 ] + self.conversation_history[:-1]  # Exclude the current message as we'll send it separately
                 
                 chat = self.model.start_chat(history=chat_history)
-                response = chat.send_message(context)
+                response = self.generate(chat, context, priority=priority, deadline=deadline)
+                if response is None:
+                    # Timed out: nothing was answered, so keep neither the turn nor its research
+                    self._drop_unanswered_turn()
+                    return {
+                        'text': LLM_TIMEOUT_TEXT,
+                        'data': None,
+                        'degraded': deadline.degraded()
+                    }
                 
                 # Add assistant response to history
                 try:
@@ -646,6 +735,8 @@ Please synthesize these results into a helpful response. Remember to:
                     "role": "model",
                     "parts": [response_text]
                 })
+                # Only keep research for turns that actually got answered
+                self.research_data[company_id] = structured_data
                 
                 # Extract tables from the response for auto-chart generation
                 tables = self.extract_tables_from_text(response_text)
@@ -662,8 +753,9 @@ Please synthesize these results into a helpful response. Remember to:
                 
                 # Return both the text response and structured data
                 return {
-                    'text': response.text,
-                    'data': structured_data
+                    'text': response_text,
+                    'data': structured_data,
+                    'degraded': deadline.degraded()
                 }
             
             else:
@@ -674,7 +766,14 @@ Please synthesize these results into a helpful response. Remember to:
                 ] + self.conversation_history[:-1]  # Exclude the current message
                 
                 chat = self.model.start_chat(history=chat_history)
-                response = chat.send_message(user_message)
+                response = self.generate(chat, user_message, priority=priority, deadline=deadline)
+                if response is None:
+                    self._drop_unanswered_turn()
+                    return {
+                        'text': LLM_TIMEOUT_TEXT,
+                        'data': None,
+                        'degraded': deadline.degraded()
+                    }
                 
                 # Add assistant response to history
                 try:
@@ -690,9 +789,14 @@ Please synthesize these results into a helpful response. Remember to:
                 
                 return {
                     'text': response_text,
-                    'data': None
+                    'data': None,
+                    'degraded': deadline.degraded()
                 }
 
+        except UpstreamBudgetExceeded as e:
+            print(f"Upstream budget exhausted: {e}")
+            self._drop_unanswered_turn()
+            raise
         except Exception as e:
             print(f"Error in logic: {e}")
             import traceback
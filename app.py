@@ -1,13 +1,23 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, HTTPException, Header
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel
 from typing import Optional
 import uuid
+import os
+import math
+import threading
+import re
+import hmac
 import logging
 from agent_logic import ResearchAgent
+from upstream import UpstreamBudgetExceeded, INTERACTIVE, tavily_scheduler, gemini_scheduler
+from deadlines import Deadline, CHAT_DEADLINE_SECONDS, snapshot_stats
+from profiling import TurnProfiler, list_profiles, get_profile, profile_summary, PROFILE_DIR
+from payloads import FastJSONResponse, compact_payload, measure, PAYLOAD_METRICS
+from payloads import snapshot_stats as payload_snapshot
+from assets import StaticAssets
 
 app = FastAPI()
 
@@ -20,61 +30,147 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={"detail": exc.errors(), "body": str(exc.body)},
     )
 
-# Mount static files
-
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Mount static files (fingerprinted and precompressed at startup)
+static_assets = StaticAssets(directory="static", prefix="/static")
+app.mount("/static", static_assets, name="static")
 
 # Templates
 templates = Jinja2Templates(directory="templates")
+templates.env.globals['static_url'] = static_assets.url
 
 # Store active sessions
 sessions = {}
+# One lock per session so a ResearchAgent only ever runs one turn at a time
+session_locks = {}
+sessions_lock = threading.Lock()
+# Last structured data sent to each session in compact mode
+session_sync = {}
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
 
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
+    profile: Optional[bool] = False
+    compact: Optional[bool] = False
+    data_version: Optional[int] = None
+
+def require_admin(token):
+    # Constant-time comparison so response timing doesn't leak the token
+    if not ADMIN_TOKEN or not hmac.compare_digest((token or '').encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
 
 @app.get("/")
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+def chat_endpoint(request: ChatRequest, raw_request: Request):
+    # Plain def: FastAPI runs blocking turns in its threadpool, keeping the event loop free
+    # The turn's latency budget starts here and flows into every stage
+    deadline = Deadline(CHAT_DEADLINE_SECONDS)
     session_id = request.session_id
+
+    # Reuse the caller's request ID if it is safe to use as a file name
+    request_id = raw_request.headers.get('x-request-id', '')
+    if not re.fullmatch(r'[A-Za-z0-9_-]{1,64}', request_id):
+        request_id = str(uuid.uuid4())
+    force_profile = request.profile or raw_request.headers.get('x-profile', '').lower() in ('1', 'true', 'yes')
     
-    if not session_id or session_id not in sessions:
-        session_id = str(uuid.uuid4())
-        sessions[session_id] = ResearchAgent()
-        print(f"Created new session: {session_id}")
-    
-    agent = sessions[session_id]
+    with sessions_lock:
+        if not session_id or session_id not in sessions:
+            session_id = str(uuid.uuid4())
+            sessions[session_id] = ResearchAgent()
+            session_locks[session_id] = threading.Lock()
+            print(f"Created new session: {session_id}")
+        agent = sessions[session_id]
+        session_lock = session_locks[session_id]
     
     try:
-        result = agent.process_message(request.message)
+        with session_lock:
+            with TurnProfiler(request_id, force=force_profile, label=request.message):
+                result = agent.process_message(request.message, priority=INTERACTIVE, deadline=deadline)
         
         # Handle both old string format and new dict format
         if isinstance(result, dict):
-            return {
+            payload = {
                 "response": result.get('text', ''),
                 "data": result.get('data'),
-                "session_id": session_id
+                "degraded": result.get('degraded', []),
+                "session_id": session_id,
+                "request_id": request_id
             }
         else:
             # Backward compatibility
-            return {
+            payload = {
                 "response": result,
                 "data": None,
-                "session_id": session_id
+                "session_id": session_id,
+                "request_id": request_id
             }
+
+        if request.compact:
+            with session_lock:
+                sent = compact_payload(payload, session_sync.setdefault(session_id, {}), request.data_version)
+            if PAYLOAD_METRICS:
+                measure(payload, sent)
+            return FastJSONResponse(sent)
+        return FastJSONResponse(payload)
+    except UpstreamBudgetExceeded as e:
+        # Fail fast with a clear status instead of piling up blocked requests
+        retry_after = max(1, math.ceil(e.retry_after))
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": str(retry_after)},
+            content={
+                "status": "upstream_busy",
+                "detail": f"The {e.api} API is at capacity right now. Please retry in {retry_after} seconds.",
+                "upstream": e.api,
+                "retry_after": e.retry_after,
+                "session_id": session_id,
+                "request_id": request_id
+            },
+        )
     except Exception as e:
         print(f"Error processing message: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stats/latency")
+async def latency_stats():
+    """Stage timeouts, hedge wins, upstream scheduler and payload counters since startup."""
+    return {
+        **snapshot_stats(),
+        "upstream": {
+            "tavily": tavily_scheduler.snapshot(),
+            "gemini": gemini_scheduler.snapshot()
+        },
+        "payload": payload_snapshot()
+    }
+
+@app.get("/admin/profiles")
+async def admin_list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Recently captured turn profiles, newest first."""
+    require_admin(x_admin_token)
+    return {"profiles": list_profiles()}
+
+@app.get("/admin/profiles/{request_id}")
+async def admin_get_profile(request_id: str, summary: bool = False, x_admin_token: Optional[str] = Header(None)):
+    """Download a profile (.prof for pstats/snakeviz, .folded for flamegraph tools)."""
+    require_admin(x_admin_token)
+    entry = get_profile(request_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if summary and entry['kind'] == 'cprofile':
+        return PlainTextResponse(profile_summary(entry))
+    return FileResponse(os.path.join(PROFILE_DIR, entry['file']), filename=entry['file'])
+
 @app.post("/reset")
 async def reset_session(request: ChatRequest):
-    if request.session_id in sessions:
-        del sessions[request.session_id]
+    with sessions_lock:
+        sessions.pop(request.session_id, None)
+        session_locks.pop(request.session_id, None)
+        session_sync.pop(request.session_id, None)
     return {"status": "reset"}
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+from starlette.requests import Request
+from starlette.responses import Response, PlainTextResponse
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+STATIC_DIR = 'static'
+# Text formats worth compressing, and the smallest file worth the trouble
+COMPRESSIBLE = {'.css', '.js', '.html', '.json', '.svg', '.txt', '.map'}
+MIN_COMPRESS_BYTES = 512
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+class Asset:
+    """One static file with its content hash and precompressed variants."""
+
+    def __init__(self, path, body):
+        self.path = path
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        root, ext = os.path.splitext(path)
+        self.hashed_path = f"{root}.{self.digest}{ext}"
+        self.media_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.media_type.startswith('text/') or self.media_type == 'application/javascript':
+            self.media_type += '; charset=utf-8'
+        self.variants = {'identity': body}
+        if ext in COMPRESSIBLE and len(body) >= MIN_COMPRESS_BYTES:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants['br'] = compressed
+
+    def etag(self, encoding):
+        # Strong ETags must differ per encoding, since the bytes differ
+        return f'"{self.digest}"' if encoding == 'identity' else f'"{self.digest}-{encoding}"'
+
+
+class StaticAssets:
+    """
+    Serves files from `directory` with content-hashed URLs.
+    Everything is read, hashed and compressed once at startup. Hashed URLs are cached
+    as immutable; plain URLs still work but must revalidate against a strong ETag.
+    """
+
+    def __init__(self, directory=STATIC_DIR, prefix='/static'):
+        self.directory = directory
+        self.prefix = prefix
+        self.assets = {}
+        self.hashed = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, directory).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    asset = Asset(path, f.read())
+                self.assets[path] = asset
+                self.hashed[asset.hashed_path] = asset
+        print(f"Fingerprinted {len(self.assets)} static assets")
+
+    def url(self, path):
+        """Public URL for a static file, fingerprinted when the file is known."""
+        asset = self.assets.get(path.lstrip('/'))
+        return f"{self.prefix}/{asset.hashed_path if asset else path.lstrip('/')}"
+
+    def response(self, request, path):
+        asset = self.hashed.get(path)
+        cache_control = IMMUTABLE
+        if asset is None:
+            asset = self.assets.get(path)
+            cache_control = REVALIDATE
+        if asset is None:
+            return PlainTextResponse('Not Found', status_code=404)
+
+        encoding = negotiate(request.headers.get('accept-encoding', ''), asset.variants)
+        headers = {
+            'Cache-Control': cache_control,
+            'ETag': asset.etag(encoding),
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        if_none_match = request.headers.get('if-none-match', '')
+        if if_none_match == '*' or headers['ETag'] in [t.strip() for t in if_none_match.split(',')]:
+            return Response(status_code=304, headers=headers)
+
+        body = asset.variants[encoding]
+        if request.method == 'HEAD':
+            headers['Content-Length'] = str(len(body))
+            return Response(status_code=200, headers=headers, media_type=asset.media_type)
+        return Response(body, headers=headers, media_type=asset.media_type)
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        if request.method not in ('GET', 'HEAD'):
+            response = PlainTextResponse('Method Not Allowed', status_code=405)
+        else:
+            # Newer Starlette keeps the mount prefix in `path`, older versions strip it
+            path = scope['path']
+            root_path = scope.get('root_path', '')
+            if root_path and path.startswith(root_path):
+                path = path[len(root_path):]
+            response = self.response(request, path.lstrip('/'))
+        await response(scope, receive, send)
+
+
+def negotiate(accept_encoding, variants):
+    """Pick the best precompressed variant the client accepts (br > gzip > identity)."""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    for encoding in ('br', 'gzip'):
+        if encoding in variants and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
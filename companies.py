@@ -0,0 +1,160 @@
+import os
+import re
+import json
+
+# Local alias file: [{"id", "name", "tickers": [...], "aliases": [...]}, ...]
+ALIAS_FILE = os.environ.get('COMPANY_ALIAS_FILE',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'company_aliases.json'))
+
+# Legal-form suffixes that never change which company is meant
+CORPORATE_SUFFIXES = {'inc', 'incorporated', 'corp', 'corporation', 'co', 'company', 'ltd', 'limited',
+                      'plc', 'llc', 'ag', 'sa', 'nv', 'se', 'group', 'holdings'}
+
+# Words after which the rest of the message names the subject ("research X", "about X")
+SUBJECT_TRIGGERS = ('research', 'about', 'on', 'for')
+# Tickers this short read as ordinary abbreviations ("the GM of ...") unless written with "$"
+MIN_BARE_TICKER_LEN = 3
+
+_POSSESSIVE = re.compile(r"['’]s\b", re.IGNORECASE)
+_TOKEN = re.compile(r"\$?[A-Za-z0-9&]+(?:[.\-][A-Za-z0-9&]+)*")
+# Where the named subject ends and talk about other companies begins
+_CLAUSE_BREAK = re.compile(r"[,;:()]|\b(?:vs|versus|compared|competitors?|rivals?|against|than|like)\b",
+                           re.IGNORECASE)
+# A possessive followed by more words ("Stripe's revenue") names the owner, not the topic
+_OWNER_POSSESSIVE = re.compile(r"['’]s\s+(?=\w)", re.IGNORECASE)
+
+
+def tokenize(text):
+    """Split text into word tokens, dropping possessives ("Apple's" -> "Apple")."""
+    return _TOKEN.findall(_POSSESSIVE.sub('', text))
+
+
+def normalize(text):
+    """Lowercased tokens with trailing corporate suffixes removed."""
+    tokens = [t.lstrip('$').lower() for t in tokenize(text)]
+    while len(tokens) > 1 and tokens[-1] in CORPORATE_SUFFIXES:
+        tokens.pop()
+    return tokens
+
+
+def split_subject(message):
+    """
+    Split a message into (prefix, subject) around the first subject trigger word.
+    Without a trigger the subject is the whole message and the prefix is empty.
+    """
+    words = message.split()
+    for i, word in enumerate(words):
+        if word.lower() in SUBJECT_TRIGGERS:
+            if i + 1 < len(words):
+                return ' '.join(words[:i]), ' '.join(words[i+1:]).strip('.,!?')
+
+    # Fallback: the whole message, trimmed if it's short
+    if len(words) <= 3:
+        return '', message.strip('.,!?')
+
+    return '', message
+
+
+def first_clause(text):
+    """
+    Leading part of `text`, before any comma or comparison ("vs", "competitor of", ...)
+    and before whatever follows a possessive ("Stripe's revenue" -> "Stripe").
+    """
+    clause = _CLAUSE_BREAK.split(text, maxsplit=1)[0]
+    owner = _OWNER_POSSESSIVE.search(clause)
+    if owner:
+        clause = clause[:owner.start()]
+    return clause.strip(' .,!?')
+
+
+def company_key(name):
+    """Stable cache/storage key for a company name not found in the index."""
+    return '-'.join(normalize(name)) or name.strip().lower()
+
+
+class CompanyIndex:
+    """
+    Hash index from normalized alias n-grams to canonical company IDs.
+    Resolution scans the message once, trying the longest alias length first at each position.
+    """
+
+    def __init__(self, entries):
+        self.companies = {}
+        self.aliases = {}
+        self.tickers = {}
+        self.capitalized_only = set()
+        self.first_tokens = set()
+        self.max_len = 1
+        for entry in entries:
+            company_id = entry['id']
+            self.companies[company_id] = {
+                'id': company_id,
+                'name': entry['name'],
+                'ticker': (entry.get('tickers') or [None])[0],
+            }
+            for alias in [entry['name']] + entry.get('aliases', []):
+                tokens = normalize(alias)
+                if tokens:
+                    self.aliases.setdefault(' '.join(tokens), company_id)
+                    self.first_tokens.add(tokens[0])
+                    self.max_len = max(self.max_len, len(tokens))
+            for ticker in entry.get('tickers', []):
+                self.tickers.setdefault(ticker.upper(), company_id)
+            # Aliases that are also everyday words ("meta", "visa") only count when capitalized
+            for alias in entry.get('capitalized_only', []):
+                self.capitalized_only.add(' '.join(normalize(alias)))
+
+    @classmethod
+    def load(cls, path=ALIAS_FILE):
+        try:
+            with open(path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Company alias index unavailable ({e}); falling back to raw names")
+            entries = []
+        index = cls(entries)
+        print(f"Loaded {len(index.companies)} companies, {len(index.aliases)} aliases")
+        return index
+
+    def resolve(self, text):
+        """Return {'id', 'name', 'ticker'} for the first company mentioned in `text`, or None."""
+        raw = tokenize(text)
+        tokens = [t.lstrip('$').lower() for t in raw]
+        # An all-caps sentence says nothing about tickers; a lone all-caps word still might
+        shouting = text.isupper() and len(raw) > 1
+        for i in range(len(tokens)):
+            if tokens[i] in self.first_tokens:
+                for n in range(min(self.max_len, len(tokens) - i), 0, -1):
+                    key = ' '.join(tokens[i:i + n])
+                    company_id = self.aliases.get(key)
+                    if company_id and key in self.capitalized_only:
+                        if not all(word.lstrip('$')[:1].isupper() for word in raw[i:i + n]):
+                            company_id = None
+                    if company_id:
+                        return self.companies[company_id]
+            # Tickers only count when written as one ("AAPL", "$aapl"), so "T" or "GM" stay words
+            word = raw[i]
+            if word.startswith('$') or (word.isupper() and len(word) >= MIN_BARE_TICKER_LEN and not shouting):
+                company_id = self.tickers.get(word.lstrip('$').upper())
+                if company_id:
+                    return self.companies[company_id]
+        return None
+
+    def resolve_message(self, message):
+        """
+        Resolve a chat message to (company or None, subject name).
+        The named subject's first clause wins; the rest of the message is only
+        consulted when the subject names nothing in the index. The subject name
+        is that first clause, so unknown companies get the same name and key
+        however the question around them is phrased.
+        """
+        prefix, subject = split_subject(message)
+        name = first_clause(subject) or subject
+        match = self.resolve(name)
+        if match is None and prefix:
+            match = self.resolve(prefix)
+        return match, name
+
+
+# Built once at import so every session shares it
+company_index = CompanyIndex.load()
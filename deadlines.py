@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Per-turn latency budget (seconds), split across pipeline stages
+CHAT_DEADLINE_SECONDS = float(os.environ.get('CHAT_DEADLINE_SECONDS', 30))
+SEARCH_STAGE_SECONDS = float(os.environ.get('SEARCH_STAGE_SECONDS', 12))
+SCRAPE_STAGE_SECONDS = float(os.environ.get('SCRAPE_STAGE_SECONDS', 8))
+LLM_RESERVE_SECONDS = float(os.environ.get('LLM_RESERVE_SECONDS', 12))
+MIN_STAGE_SECONDS = 1.0
+TAVILY_HEDGE_DELAY = float(os.environ.get('TAVILY_HEDGE_DELAY', 2.0))
+
+# Upstream calls run here so a caller can stop waiting once its deadline passes
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='upstream')
+
+_stats_lock = threading.Lock()
+latency_stats = {
+    'stage_timeouts': {},
+    'stage_skipped': {},
+    'hedges_sent': 0,
+    'hedge_wins': 0,
+}
+
+
+class StageTimeout(Exception):
+    """Raised when a pipeline stage runs past its deadline."""
+
+
+def _bump(key, stage=None):
+    with _stats_lock:
+        if stage is None:
+            latency_stats[key] += 1
+        else:
+            latency_stats[key][stage] = latency_stats[key].get(stage, 0) + 1
+
+
+class Deadline:
+    """
+    Absolute time budget for one /chat turn.
+    Sub-deadlines share the parent's event log so every stage is reported together.
+    """
+
+    def __init__(self, seconds, parent=None):
+        self.started = time.monotonic()
+        self.expires = self.started + max(seconds, 0.0)
+        self.events = parent.events if parent is not None else []
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def sub(self, cap, reserve=0.0):
+        """Child deadline of at most `cap` seconds that leaves `reserve` seconds for later stages."""
+        return Deadline(min(cap, self.remaining() - reserve), parent=self)
+
+    def record(self, stage, status, started):
+        """Log a stage outcome ('ok', 'timeout', 'skipped' or 'error') with its elapsed time."""
+        elapsed = round(time.monotonic() - started, 3)
+        self.events.append({'stage': stage, 'status': status, 'elapsed': elapsed})
+        if status == 'timeout':
+            _bump('stage_timeouts', stage)
+        elif status == 'skipped':
+            _bump('stage_skipped', stage)
+        print(f"Stage {stage}: {status} in {elapsed}s")
+
+    def degraded(self):
+        return [e['stage'] for e in self.events if e['status'] != 'ok']
+
+
+def run_with_timeout(fn, deadline, *args, **kwargs):
+    """Run `fn` on the upstream pool and wait for it no longer than `deadline` allows."""
+    if deadline.expired():
+        raise StageTimeout("deadline already expired")
+    future = _pool.submit(fn, *args, **kwargs)
+    done, _ = wait([future], timeout=deadline.remaining())
+    if not done:
+        raise StageTimeout("no response within deadline")
+    return future.result()
+
+
+def hedged_call(fn, deadline, hedge_delay=TAVILY_HEDGE_DELAY, hedge_fn=None):
+    """
+    Run an idempotent call and, if it is still pending after `hedge_delay`,
+    fire a second copy (`hedge_fn`, defaulting to `fn`) and take whichever finishes first.
+    """
+    if deadline.expired():
+        raise StageTimeout("deadline already expired")
+    primary = _pool.submit(fn)
+    done, _ = wait([primary], timeout=min(hedge_delay, deadline.remaining()))
+    if done:
+        return primary.result()
+
+    pending = [primary]
+    hedge = None
+    if not deadline.expired():
+        hedge = _pool.submit(hedge_fn or fn)
+        pending.append(hedge)
+        _bump('hedges_sent')
+
+    error = None
+    while pending:
+        done, not_done = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            raise StageTimeout("no response within deadline")
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    _bump('hedge_wins')
+                return future.result()
+            # Prefer the primary's error; a rejected hedge is not interesting
+            if error is None or future is primary:
+                error = future.exception()
+        pending = list(not_done)
+    raise error
+
+
+def snapshot_stats():
+    with _stats_lock:
+        return {
+            'stage_timeouts': dict(latency_stats['stage_timeouts']),
+            'stage_skipped': dict(latency_stats['stage_skipped']),
+            'hedges_sent': latency_stats['hedges_sent'],
+            'hedge_wins': latency_stats['hedge_wins'],
+        }
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import threading
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Falls back to the stdlib encoder
+    orjson = None
+
+# When on, every compact turn is also encoded the default way to measure the savings
+PAYLOAD_METRICS = os.environ.get('PAYLOAD_METRICS', '').lower() in ('1', 'true', 'yes')
+
+_MISSING = object()
+_stats_lock = threading.Lock()
+payload_stats = {
+    'turns': 0,
+    'bytes_default': 0,
+    'bytes_sent': 0,
+    'encode_ms_default': 0.0,
+    'encode_ms_sent': 0.0,
+}
+
+
+def dumps(content):
+    """Serialize a response body to bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with `dumps`; content must already be plain JSON types."""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def compact_data(data):
+    """Drop fields the frontend derives itself (table chart_data) or never reads (page excerpt)."""
+    data = dict(data)
+    if data.get('tables'):
+        data['tables'] = [{'headers': t['headers'], 'rows': t['rows']} for t in data['tables']]
+    if data.get('scraped_info'):
+        data['scraped_info'] = {k: v for k, v in data['scraped_info'].items() if k != 'key_points'}
+    return data
+
+
+def diff_data(data, previous):
+    """Top-level delta of `data` against `previous`: (changed fields, removed keys)."""
+    changed = {k: v for k, v in data.items() if previous.get(k, _MISSING) != v}
+    removed = [k for k in previous if k not in data]
+    return changed, removed
+
+
+def compact_payload(payload, state, client_version=None):
+    """
+    Build the compact form of a /chat payload.
+    `state` is the session's sync record ({'version', 'data'}) and is updated in place;
+    `data` is sent as a delta only if the client confirms it holds the current version.
+    """
+    data = payload.get('data')
+    out = dict(payload)
+    if not data:
+        return out
+
+    data = compact_data(data)
+    version = state.get('version', 0) + 1
+    if state.get('data') is not None and client_version == state.get('version'):
+        changed, removed = diff_data(data, state['data'])
+        out['data'] = changed
+        out['data_delta'] = True
+        if removed:
+            out['data_removed'] = removed
+    else:
+        out['data'] = data
+        out['data_delta'] = False
+    out['data_version'] = version
+    state['version'] = version
+    state['data'] = data
+    return out
+
+
+def measure(default_payload, sent_payload):
+    """Record bytes and encode time of the default FastAPI path versus what was sent."""
+    started = time.perf_counter()
+    default_body = json.dumps(jsonable_encoder(default_payload), ensure_ascii=False,
+                              allow_nan=False, separators=(',', ':')).encode('utf-8')
+    default_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    sent_body = dumps(sent_payload)
+    sent_ms = (time.perf_counter() - started) * 1000
+
+    with _stats_lock:
+        payload_stats['turns'] += 1
+        payload_stats['bytes_default'] += len(default_body)
+        payload_stats['bytes_sent'] += len(sent_body)
+        payload_stats['encode_ms_default'] += default_ms
+        payload_stats['encode_ms_sent'] += sent_ms
+
+
+def snapshot_stats():
+    """Cumulative totals plus per-turn averages of bytes and milliseconds saved."""
+    with _stats_lock:
+        stats = dict(payload_stats)
+    turns = stats['turns'] or 1
+    stats['avg_bytes_saved'] = round((stats['bytes_default'] - stats['bytes_sent']) / turns)
+    stats['avg_encode_ms_saved'] = round((stats['encode_ms_default'] - stats['encode_ms_sent']) / turns, 3)
+    stats['encoder'] = 'orjson' if orjson is not None else 'json'
+    return stats
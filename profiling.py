@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import threading
+import cProfile
+import pstats
+import io
+import json
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+
+# Where captured profiles are written, and how many are kept
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+# Turns slower than this are kept automatically (0 disables auto capture)
+PROFILE_SLOW_SECONDS = float(os.environ.get('PROFILE_SLOW_SECONDS', 15))
+SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+
+_lock = threading.Lock()
+_recent = deque()
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack at a fixed interval from a helper thread.
+    Cheap enough to run on every turn; output is in collapsed "flamegraph" format.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def render(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+class TurnProfiler:
+    """
+    Profiles one chat turn. With `force=True` the turn is traced with cProfile and
+    always saved; otherwise a sampling profile is kept only if the turn is slow.
+    """
+
+    def __init__(self, request_id, force=False, label=''):
+        self.request_id = request_id
+        self.force = force
+        self.label = label[:80]
+        self._cprofile = None
+        self._sampler = None
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        if self.force:
+            self._cprofile = cProfile.Profile()
+            try:
+                self._cprofile.enable()
+            except ValueError:
+                # Another profiler already owns this interpreter; sample instead
+                self._cprofile = None
+        if self._cprofile is None and (self.force or PROFILE_SLOW_SECONDS > 0):
+            self._sampler = SamplingProfiler(threading.get_ident())
+            self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.monotonic() - self.started
+        try:
+            if self._cprofile is not None:
+                self._cprofile.disable()
+                self._save('prof', elapsed, self._cprofile.dump_stats)
+            elif self._sampler is not None:
+                self._sampler.stop()
+                if self.force or elapsed >= PROFILE_SLOW_SECONDS:
+                    text = self._sampler.render()
+                    self._save('folded', elapsed, lambda path: _write_text(path, text))
+        except Exception as e:
+            # Profiling is diagnostics only; it must never fail the turn it measured
+            print(f"Error saving profile for {self.request_id}: {e}")
+        return False
+
+    def _save(self, kind, elapsed, writer):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        # Request IDs can be client-supplied and reused, so every capture gets its own file
+        filename = f"{self.request_id}-{uuid.uuid4().hex[:8]}.{kind}"
+        writer(os.path.join(PROFILE_DIR, filename))
+        entry = {
+            'request_id': self.request_id,
+            'file': filename,
+            'kind': 'cprofile' if kind == 'prof' else 'sampling',
+            'trigger': 'requested' if self.force else 'slow_turn',
+            'elapsed': round(elapsed, 3),
+            'label': self.label,
+            'created': datetime.now().isoformat(),
+        }
+        # Sidecar metadata lets the list be rebuilt after a restart
+        _write_text(os.path.join(PROFILE_DIR, filename + '.json'), json.dumps(entry))
+        with _lock:
+            _recent.append(entry)
+            _prune()
+        print(f"Saved {entry['kind']} profile for {self.request_id} ({entry['elapsed']}s)")
+
+
+def _write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def _prune():
+    """Drop the oldest profiles beyond PROFILE_KEEP; callers must hold _lock."""
+    while len(_recent) > PROFILE_KEEP:
+        old = _recent.popleft()
+        for path in (old['file'], old['file'] + '.json'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, path))
+            except OSError:
+                pass
+
+
+def _load_existing():
+    """Rebuild the recent-profile list from PROFILE_DIR, oldest first."""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except OSError:
+        return
+    entries = []
+    for name in names:
+        if not name.endswith(('.prof', '.folded')):
+            continue
+        path = os.path.join(PROFILE_DIR, name)
+        try:
+            with open(path + '.json', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            # No usable sidecar: recover what the file itself tells us
+            try:
+                created = datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+            except OSError:
+                continue
+            stem, ext = os.path.splitext(name)
+            entry = {
+                'request_id': stem.rsplit('-', 1)[0] if '-' in stem else stem,
+                'file': name,
+                'kind': 'cprofile' if ext == '.prof' else 'sampling',
+                'trigger': 'unknown',
+                'elapsed': None,
+                'label': '',
+                'created': created,
+            }
+        entries.append(entry)
+    with _lock:
+        _recent.extend(sorted(entries, key=lambda e: e['created']))
+        _prune()
+
+
+def list_profiles():
+    """Most recent profiles first."""
+    with _lock:
+        return list(reversed(_recent))
+
+
+def get_profile(request_id):
+    """Newest profile captured for `request_id`."""
+    with _lock:
+        for entry in reversed(_recent):
+            if entry['request_id'] == request_id:
+                return entry
+    return None
+
+
+def profile_summary(entry, limit=30):
+    """Human-readable top functions by cumulative time for a cProfile capture."""
+    out = io.StringIO()
+    stats = pstats.Stats(os.path.join(PROFILE_DIR, entry['file']), stream=out)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+_load_existing()
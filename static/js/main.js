@@ -13,6 +13,8 @@ document.addEventListener('DOMContentLoaded', () => {
     let recognition = null;
     let isListening = false;
     let isAutoPlayEnabled = true; // Default to true as per request
+    let lastData = null; // Last structured data, base for compact deltas
+    let dataVersion = null;
 
     // Load chat history from localStorage
     function loadChatHistory() {
@@ -280,10 +282,13 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
         try {
-            const payload = { message: text };
+            const payload = { message: text, compact: true };
             if (sessionId) {
                 payload.session_id = sessionId;
             }
+            if (dataVersion !== null) {
+                payload.data_version = dataVersion;
+            }
 
             console.log("Sending message:", payload);
 
@@ -295,6 +300,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify(payload)
             });
 
+            if (response.status === 503) {
+                // Upstream rate limit budget exhausted; server asks us to retry later
+                const busy = await response.json();
+                throw new Error(busy.detail || 'Service is busy');
+            }
+
             if (!response.ok) {
                 throw new Error(`Server error: ${response.status}`);
             }
@@ -304,7 +315,18 @@ document.addEventListener('DOMContentLoaded', () => {
             sessionId = data.session_id;
             localStorage.setItem('aura_session_id', sessionId);
 
-            addMessage(data.response, 'bot', data.data);
+            // Compact responses only carry fields that changed since dataVersion
+            let structuredData = data.data;
+            if (data.data_version !== undefined) {
+                if (data.data_delta && lastData) {
+                    structuredData = Object.assign({}, lastData, data.data);
+                    (data.data_removed || []).forEach(key => delete structuredData[key]);
+                }
+                lastData = structuredData;
+                dataVersion = data.data_version;
+            }
+
+            addMessage(data.response, 'bot', structuredData);
         } catch (error) {
             console.error("Chat error:", error);
             addMessage('Error: ' + error.message + '. Please try again.', 'bot');
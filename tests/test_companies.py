@@ -0,0 +1,71 @@
+import pytest
+
+from companies import company_index, company_key, split_subject
+
+
+def resolved_id(message):
+    match, _ = company_index.resolve_message(message)
+    return match['id'] if match else None
+
+
+@pytest.mark.parametrize('message, expected', [
+    ("Tell me about Apple's revenue", 'apple'),
+    ("research apple inc.", 'apple'),
+    ("Tell me about the revenue of Apple", 'apple'),
+    ("What about $aapl", 'apple'),
+    ("MSFT earnings", 'microsoft'),
+    ("Is Apple good for investors", 'apple'),
+    ("Research Meta", 'meta'),
+    ("Tell me about JPMorgan Chase & Co.", 'jpmorgan'),
+    ("Research $GM", 'general-motors'),
+    ("research AAPL", 'apple'),
+    ("Tell me about NVDA", 'nvidia'),
+    ("Tell me about TSLA.", 'tesla'),
+    ("AAPL", 'apple'),
+])
+def test_resolves_named_company(message, expected):
+    assert resolved_id(message) == expected
+
+
+@pytest.mark.parametrize('message', [
+    "Tell me about Stripe, a competitor of PayPal",
+    "What about a meta analysis of Stripe",
+    "Research the GM of Stripe",
+])
+def test_other_company_in_message_does_not_replace_subject(message):
+    match, subject = company_index.resolve_message(message)
+    assert match is None
+    assert 'Stripe' in subject
+
+
+@pytest.mark.parametrize('message', [
+    "research the meta of this market",
+    "tell me about chase the leads strategy",
+    "research visa requirements for engineers",
+    "tell me about snowflake patterns",
+    "research coke bottle recycling",
+])
+def test_common_word_aliases_need_capitals(message):
+    assert resolved_id(message) is None
+
+
+def test_subject_matches_original_extraction():
+    assert split_subject("Tell me about Stripe, a competitor of PayPal") == ('Tell me', 'Stripe, a competitor of PayPal')
+    assert split_subject("Tesla news!") == ('', 'Tesla news')
+    assert split_subject("what is going on lately here") == ('what is going', 'lately here')
+
+
+@pytest.mark.parametrize('message', [
+    "Tell me about Stripe's revenue",
+    "research stripe inc.",
+    "Tell me about Stripe, a competitor of PayPal",
+    "research Stripe vs Adyen",
+])
+def test_unknown_company_name_comes_from_first_clause(message):
+    match, name = company_index.resolve_message(message)
+    assert match is None
+    assert company_key(name) == 'stripe'
+
+
+def test_company_key_normalizes_suffixes_and_possessives():
+    assert company_key("Apple Inc.") == company_key("apple's") == 'apple'
@@ -0,0 +1,184 @@
+import os
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# Request priorities (lower value is served first)
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class UpstreamBudgetExceeded(Exception):
+    """Raised when an upstream API has no budget left for this call."""
+
+    def __init__(self, api, retry_after, reason="rate limit budget exhausted"):
+        self.api = api
+        self.retry_after = round(max(retry_after, 0.0), 2)
+        self.reason = reason
+        super().__init__(f"{api} {reason}, retry after {self.retry_after}s")
+
+
+def is_rate_limited(exc):
+    """Return True if an exception from Tavily/Gemini represents an HTTP 429."""
+    for attr in ('code', 'status_code'):
+        if getattr(exc, attr, None) == 429:
+            return True
+    response = getattr(exc, 'response', None)
+    if getattr(response, 'status_code', None) == 429:
+        return True
+    # Match on status codes and named exception types only; message text is too loose
+    return type(exc).__name__ in ('ResourceExhausted', 'TooManyRequests', 'UsageLimitExceededError')
+
+
+class TokenBucket:
+    """Classic token bucket; callers must hold the owning scheduler's lock."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, tokens):
+        """Seconds until `tokens` tokens will be available."""
+        self.refill()
+        deficit = tokens - self.tokens
+        return 0.0 if deficit <= 0 else deficit / self.rate
+
+
+class UpstreamScheduler:
+    """
+    Admits calls to a single upstream API through a token bucket.
+    Waiting callers are served in priority order (interactive before background),
+    429 responses are retried with jittered exponential backoff, and callers
+    fail fast with UpstreamBudgetExceeded instead of queueing indefinitely.
+    """
+
+    def __init__(self, name, rate, capacity, max_wait=5.0, max_waiters=16,
+                 max_retries=3, base_backoff=0.5, max_backoff=8.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, capacity)
+        self.max_wait = max_wait
+        self.max_waiters = max_waiters
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self.stats = {'admitted': 0, 'rejected': 0, 'retried_429': 0}
+
+    def _check_locked(self, priority, max_wait):
+        # Everyone already queued at equal or higher priority goes first
+        ahead = sum(1 for p, _ in self._waiters if p <= priority)
+        estimate = self.bucket.time_until(ahead + 1)
+        if len(self._waiters) >= self.max_waiters or estimate > max_wait:
+            self.stats['rejected'] += 1
+            raise UpstreamBudgetExceeded(self.name, estimate)
+
+    def check(self, priority=INTERACTIVE, max_wait=None):
+        """Raise UpstreamBudgetExceeded now if a call would be rejected, without taking a token."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._cond:
+            self._check_locked(priority, max_wait)
+
+    def acquire(self, priority=INTERACTIVE, max_wait=None):
+        """Block until a token is granted, or raise UpstreamBudgetExceeded."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._cond:
+            self._check_locked(priority, max_wait)
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            deadline = time.monotonic() + max_wait
+            try:
+                while True:
+                    wait = self.bucket.time_until(1)
+                    if self._waiters[0] == entry and wait == 0:
+                        heapq.heappop(self._waiters)
+                        self.bucket.tokens -= 1
+                        self.stats['admitted'] += 1
+                        self._cond.notify_all()
+                        return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiters.remove(entry)
+                        heapq.heapify(self._waiters)
+                        self._cond.notify_all()
+                        self.stats['rejected'] += 1
+                        raise UpstreamBudgetExceeded(self.name, wait)
+                    # Non-head waiters still wake periodically in case the head leaves
+                    self._cond.wait(min(remaining, wait if wait > 0 else 0.05))
+            except UpstreamBudgetExceeded:
+                raise
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+    def _count(self, key):
+        with self._cond:
+            self.stats[key] += 1
+
+    def snapshot(self):
+        """Consistent copy of the admission counters."""
+        with self._cond:
+            return dict(self.stats)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff delay for the given retry attempt."""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+    def call(self, fn, *args, priority=INTERACTIVE, max_wait=None, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` under this API's budget.
+        `max_wait` bounds all time spent waiting here, token queueing and 429 backoff together.
+        """
+        give_up_at = time.monotonic() + (self.max_wait if max_wait is None else max_wait)
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, max(give_up_at - time.monotonic(), 0.0))
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limited(e):
+                    raise
+                if attempt == self.max_retries:
+                    self._count('rejected')
+                    raise UpstreamBudgetExceeded(self.name, self.backoff(attempt + 1),
+                                                 reason="returned 429 after retries") from e
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    self._count('rejected')
+                    raise UpstreamBudgetExceeded(self.name, self.backoff(attempt + 1),
+                                                 reason="returned 429 with no time left to retry") from e
+                delay = min(self.backoff(attempt), remaining)
+                self._count('retried_429')
+                print(f"{self.name} returned 429, retrying in {delay:.2f}s (attempt {attempt + 1})")
+                time.sleep(delay)
+                # Drain the bucket so other callers back off with us
+                with self._cond:
+                    self.bucket.refill()
+                    self.bucket.tokens = min(self.bucket.tokens, 0.0)
+
+
+# Shared schedulers, one per upstream API (limits overridable via environment)
+tavily_scheduler = UpstreamScheduler(
+    'tavily',
+    rate=float(os.environ.get('TAVILY_RATE_PER_SEC', 2)),
+    capacity=float(os.environ.get('TAVILY_BURST', 8)),
+)
+gemini_scheduler = UpstreamScheduler(
+    'gemini',
+    rate=float(os.environ.get('GEMINI_RATE_PER_SEC', 0.25)),
+    capacity=float(os.environ.get('GEMINI_BURST', 5)),
+    max_wait=10.0,
+)